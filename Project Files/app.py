@@ -9,50 +9,179 @@ Usage:
 """
 
 
+import hashlib
+import io
 import os
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Iterator
 from PIL import Image
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as gexc
 
 
 # ============================================================
 # CONFIGURATION
 # ============================================================
 
-load_dotenv(dotenv_path=".env")
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+@st.cache_resource(show_spinner=False)
+def _bootstrap():
+    """Load .env and configure the Gemini SDK once per process.
+
+    Returns the API key, or None when it isn't set. Nothing runs at import,
+    so other tools can import this module without side effects.
+    """
+    load_dotenv(dotenv_path=".env")
+    api_key = os.getenv("GOOGLE_API_KEY")
+    if api_key:
+        # Pin the gRPC transport so all models share one long-lived HTTP/2 channel
+        genai.configure(
+            api_key=api_key,
+            transport="grpc",
+            client_options={"api_endpoint": "generativelanguage.googleapis.com"},
+        )
+    return api_key
 
-if not GOOGLE_API_KEY:
-    GEMINI_MODEL = "gemini-2.5-flash"
-    AVAILABLE_MODELS = []
-else:
-    genai.configure(api_key=GOOGLE_API_KEY)
-    
-    # Get actual available models
-    AVAILABLE_MODELS = []
+
+@st.cache_resource
+def _get_model(name: str) -> genai.GenerativeModel:
+    """Return a cached Gemini model client so reruns reuse its connection"""
+    return genai.GenerativeModel(name, system_instruction=ARTIFACT_ANALYSIS_PROMPT)
+
+
+# How long a request waits for a free slot before giving up
+SLOT_WAIT_SECONDS = 60
+
+
+@st.cache_resource
+def _request_slots() -> threading.BoundedSemaphore:
+    """Process-wide cap on concurrent Gemini requests across all sessions"""
+    value = os.getenv("GEMINI_CONCURRENCY", "2")
     try:
-        for model in genai.list_models():
-            model_name = model.name.split('/')[-1]
-            # Only include models that support generateContent
-            if hasattr(model, 'supported_generation_methods'):
-                if 'generateContent' in model.supported_generation_methods:
-                    AVAILABLE_MODELS.append(model_name)
-    except Exception as e:
-        # Fallback models if list_models fails
-        AVAILABLE_MODELS = ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.5-pro"]
-    
-    # Select the best available model (prefer 2.5-flash)
-    if "gemini-2.5-flash" in AVAILABLE_MODELS:
-        GEMINI_MODEL = "gemini-2.5-flash"
-    elif "gemini-2.0-flash" in AVAILABLE_MODELS:
-        GEMINI_MODEL = "gemini-2.0-flash"
-    elif "gemini-2.5-pro" in AVAILABLE_MODELS:
-        GEMINI_MODEL = "gemini-2.5-pro"
-    elif AVAILABLE_MODELS:
-        GEMINI_MODEL = AVAILABLE_MODELS[0]
+        limit = int(value)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValueError(f"GEMINI_CONCURRENCY must be a positive integer, got {value!r}")
+    return threading.BoundedSemaphore(limit)
+
+
+class AnalysisError(Exception):
+    """Gemini analysis failed; the underlying API error, if any, is __cause__"""
+
+
+class QueueTimeoutError(AnalysisError):
+    """No request slot freed up within SLOT_WAIT_SECONDS"""
+
+
+@contextmanager
+def _request_slot():
+    """Hold one shared request slot, telling the user while the request is queued"""
+    slots = _request_slots()
+    if not slots.acquire(blocking=False):
+        notice = st.empty()
+        notice.info(" Other analyses are in progress. Your request is queued...")
+        acquired = slots.acquire(timeout=SLOT_WAIT_SECONDS)
+        notice.empty()
+        if not acquired:
+            raise QueueTimeoutError("Gemini is busy with other requests. Please try again in a minute.")
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def _list_generate_models() -> list:
+    """Return names of models that support generateContent"""
+    available_models = []
+    for model in genai.list_models():
+        model_name = model.name.split('/')[-1]
+        # Only include models that support generateContent
+        if hasattr(model, 'supported_generation_methods'):
+            if 'generateContent' in model.supported_generation_methods:
+                available_models.append(model_name)
+    return available_models
+
+
+def _select_model(available_models: list) -> str:
+    """Select the best available model (prefer 2.5-flash)"""
+    if "gemini-2.5-flash" in available_models:
+        return "gemini-2.5-flash"
+    elif "gemini-2.0-flash" in available_models:
+        return "gemini-2.0-flash"
+    elif "gemini-2.5-pro" in available_models:
+        return "gemini-2.5-pro"
+    elif available_models:
+        return available_models[0]
     else:
-        GEMINI_MODEL = "gemini-2.5-flash"  # Default fallback
+        return "gemini-2.5-flash"  # Default fallback
+
+
+def _start_model_discovery(api_key: str) -> Future:
+    """Run _load_models on a background thread so first paint isn't blocked.
+
+    The thread gets the session's script context attached, as Streamlit
+    expects for threads that call cached functions.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(_load_models(api_key))
+        except Exception as e:
+            future.set_exception(e)
+
+    thread = threading.Thread(target=run, daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx())
+    thread.start()
+    return future
+
+
+@st.cache_resource(ttl=24 * 60 * 60, show_spinner=False)
+def _discover_models(api_key: str):
+    """Fetch models that support generateContent and pick the preferred one.
+
+    Cached per process so Streamlit reruns don't repeat the network call.
+    """
+    available_models = _list_generate_models()
+    return available_models, _select_model(available_models)
+
+
+# After a failed lookup, serve the fallback list for this long before retrying
+DISCOVERY_RETRY_SECONDS = 5 * 60
+
+
+@st.cache_resource
+def _discovery_failures() -> dict:
+    """Process-wide time of the last failed model lookup, per API key"""
+    return {}
+
+
+def _load_models(api_key: str):
+    """Discover models, falling back to known defaults if the lookup fails.
+
+    Failures aren't stored by the 24h cache. Instead the failure time is
+    remembered, and the lookup is only retried once DISCOVERY_RETRY_SECONDS
+    have passed, so a bad key or hanging network doesn't cost an API call
+    on every rerun.
+    """
+    failures = _discovery_failures()
+    failed_at = failures.get(api_key)
+    if failed_at is None or time.monotonic() - failed_at >= DISCOVERY_RETRY_SECONDS:
+        try:
+            models = _discover_models(api_key)
+            failures.pop(api_key, None)
+            return models
+        except Exception:
+            failures[api_key] = time.monotonic()
+
+    available_models = ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.5-pro"]
+    return available_models, _select_model(available_models)
 
 
 # ============================================================
@@ -60,23 +189,145 @@ else:
 # ============================================================
 
 ARTIFACT_ANALYSIS_PROMPT = """
-You are an expert archaeologist and historian specializing in artifact analysis.
-
-Analyze the provided image of a historical artifact and generate a comprehensive professional report.
-
-Please include:
-1. **Artifact Type & Classification** - What category does this artifact belong to?
-2. **Estimated Period/Era** - When was this likely created? (with confidence level)
-3. **Materials & Composition** - What materials are visible and their significance?
-4. **Dimensions & Scale** - Approximate size and proportions
-5. **Craftsmanship & Technique** - How was this made? What skills were required?
-6. **Condition Assessment** - Current state of preservation, visible wear, damage
-7. **Cultural & Historical Significance** - Why is this important?
-8. **Possible Origin & Geographic Location** - Where might this have come from?
-9. **Similar Artifacts** - Known comparative examples
-10. **Recommendations for Further Study** - What tests or analysis would help?
-
-Format in clear, structured markdown. Add brief disclaimers about visual-only analysis limitations.
+You are an expert archaeologist and historian. Analyze the artifact in the image and write a concise professional report in markdown (at most 600 words) covering:
+
+1. **Type & Classification**
+2. **Estimated Period** (with confidence level)
+3. **Materials & Technique**
+4. **Dimensions & Condition**
+5. **Cultural Significance & Likely Origin**
+6. **Comparable Artifacts**
+7. **Recommended Further Study**
+
+End with a one-line note that the analysis is based on the image alone.
+"""
+
+
+# Caps response time. Gemini 2.5 spends thinking tokens from the same
+# output budget, so this leaves headroom above the ~600-word report
+GENERATION_CONFIG = genai.types.GenerationConfig(
+    max_output_tokens=2048,
+    temperature=0.4,
+)
+
+
+# Upload previews, served by Streamlit at app/static/uploads/ when static
+# serving is enabled. Anything here is public to every visitor of the app,
+# and only the newest MAX_STATIC_UPLOADS files are kept
+STATIC_UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "uploads")
+MAX_STATIC_UPLOADS = 50
+# The upload's own extension is user-supplied; only these are written as-is
+STATIC_EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+# ============================================================
+# STYLES
+# ============================================================
+
+# Built once at import; Streamlit drops elements that aren't re-emitted,
+# so main() still writes this on every rerun
+CUSTOM_CSS = """
+<style>
+    /* Theme Colors */
+    :root {
+        --primary-color: #8B4513;
+        --secondary-color: #D2B48C;
+        --accent-color: #CD853F;
+    }
+
+    /* Header styling */
+    .header-container {
+        background: linear-gradient(135deg, #8B4513 0%, #CD853F 100%);
+        padding: 2.5rem;
+        border-radius: 12px;
+        margin-bottom: 2rem;
+        box-shadow: 0 8px 20px rgba(139, 69, 19, 0.25);
+    }
+
+    .header-container h1 {
+        color: white;
+        margin: 0;
+        font-size: 2.8rem;
+        margin-bottom: 0.5rem;
+        text-shadow: 2px 2px 4px rgba(0,0,0,0.2);
+    }
+
+    .header-container p {
+        color: #FFF8DC;
+        margin: 0;
+        font-size: 1.15rem;
+    }
+
+    /* Card styling */
+    .info-card {
+        background: linear-gradient(135deg, #FFF8DC 0%, #FFE4B5 100%);
+        padding: 1.5rem;
+        border-radius: 10px;
+        border-left: 5px solid #CD853F;
+        box-shadow: 0 4px 12px rgba(139, 69, 19, 0.15);
+        margin-bottom: 1rem;
+    }
+
+    /* Button styling */
+    .stButton > button {
+        background: linear-gradient(135deg, #8B4513 0%, #CD853F 100%) !important;
+        color: white !important;
+        border: none !important;
+        border-radius: 8px !important;
+        padding: 0.8rem 2rem !important;
+        font-weight: 700 !important;
+        font-size: 1rem !important;
+        transition: all 0.3s ease !important;
+        box-shadow: 0 4px 15px rgba(139, 69, 19, 0.3) !important;
+    }
+
+    .stButton > button:hover {
+        transform: translateY(-3px) !important;
+        box-shadow: 0 8px 20px rgba(139, 69, 19, 0.4) !important;
+    }
+
+    /* Text area styling */
+    .stTextArea > div > div > textarea {
+        border-radius: 8px !important;
+        border: 2px solid #D2B48C !important;
+    }
+
+    /* Expander styling */
+    .streamlit-expanderHeader {
+        background-color: #FFF8DC !important;
+        border-radius: 8px !important;
+        border: 2px solid #D2B48C !important;
+    }
+
+    /* Success/Info messages */
+    .stSuccess {
+        background-color: #E8F5E9 !important;
+        border-left: 5px solid #4CAF50 !important;
+    }
+
+    .stInfo {
+        background-color: #E3F2FD !important;
+        border-left: 5px solid #2196F3 !important;
+    }
+
+    .stWarning {
+        background-color: #FFF3E0 !important;
+        border-left: 5px solid #FF9800 !important;
+    }
+
+    .stError {
+        background-color: #FFEBEE !important;
+        border-left: 5px solid #F44336 !important;
+    }
+
+    /* Divider */
+    hr {
+        border: none;
+        height: 2px;
+        background: linear-gradient(90deg, transparent, #CD853F, transparent);
+        margin: 2rem 0;
+    }
+</style>
 """
 
 
@@ -84,41 +335,177 @@ Format in clear, structured markdown. Add brief disclaimers about visual-only an
 # CORE FUNCTION
 # ============================================================
 
-def get_gemini_analysis(user_notes: str, pil_image: Image.Image) -> str:
-    """Generate artifact analysis using Gemini AI"""
-    
-    # Use available models, fallback to defaults if empty
-    models_to_try = AVAILABLE_MODELS if AVAILABLE_MODELS else ["gemini-2.5-flash", "gemini-2.0-flash", "gemini-2.5-pro"]
-    
-    last_error = None
-    
-    for model_name in models_to_try:
+def _image_hash(file_bytes: bytes) -> str:
+    """Checksum of the uploaded bytes, computed once per rerun.
+
+    Cached helpers below take this as their key and receive the bytes as an
+    underscore-prefixed argument, which Streamlit leaves out of cache hashing.
+    """
+    return hashlib.blake2b(file_bytes, digest_size=16).hexdigest()
+
+
+# Decoded RGB images are large (~36 MB for 12 MP), so keep only a few
+@st.cache_data(show_spinner=False, max_entries=8, ttl=60 * 60)
+def _load_image(image_hash: str, _file_bytes: bytes) -> Image.Image:
+    """Decode uploaded bytes once; reruns with the same upload hit the cache"""
+    return Image.open(io.BytesIO(_file_bytes)).convert("RGB")
+
+
+def _publish_static(image_hash: str, file_bytes: bytes, extension: str) -> str:
+    """Write the upload to the static folder once and return its app URL.
+
+    Streamlit serves static/ directly (server.enableStaticServing), so the
+    preview doesn't re-encode the image through st.image on every rerun.
+    """
+    if extension not in STATIC_EXTENSIONS:
+        extension = ".jpg"
+    file_name = f"{image_hash}{extension}"
+    path = os.path.join(STATIC_UPLOAD_DIR, file_name)
+    if os.path.exists(path):
+        # Mark as recently used so pruning keeps it
+        os.utime(path)
+    else:
+        os.makedirs(STATIC_UPLOAD_DIR, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(file_bytes)
+        _prune_static_uploads()
+    return f"app/static/uploads/{file_name}"
+
+
+def _prune_static_uploads():
+    """Delete all but the most recently used MAX_STATIC_UPLOADS previews"""
+    paths = [os.path.join(STATIC_UPLOAD_DIR, name) for name in os.listdir(STATIC_UPLOAD_DIR)]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[MAX_STATIC_UPLOADS:]:
         try:
-            model = genai.GenerativeModel(model_name)
-            
-            content = [ARTIFACT_ANALYSIS_PROMPT]
+            os.remove(path)
+        except OSError:
+            # Another session may have removed it already
+            pass
+
+
+def _analysis_key(image_hash: str, user_notes: str, model_name: str) -> tuple:
+    """Identify a report by image content, user notes and model"""
+    return (image_hash, user_notes, model_name)
+
 
-            if user_notes.strip():
-                content.append(f"\nAdditional Context from User: {user_notes}\n")
+@st.cache_data(show_spinner=False, max_entries=32, ttl=60 * 60)
+def _prepare_for_gemini(image_hash: str, _file_bytes: bytes, max_side: int = 1024, quality: int = 80) -> dict:
+    """Downscale the image and encode it as WebP inline data for Gemini.
 
-            content.append(pil_image)
+    Passing raw bytes skips the SDK's own lossless PNG re-encode, and WebP
+    comes out around 30% smaller than JPEG at the same visual quality.
+    """
+    # st.cache_data returns a fresh copy, so resizing in place is safe
+    resized = _load_image(image_hash, _file_bytes)
+    resized.thumbnail((max_side, max_side), Image.LANCZOS)
 
-            response = model.generate_content(content)
-            return response.text
+    buf = io.BytesIO()
+    resized.save(buf, "WEBP", quality=quality, method=4)
+    return {"mime_type": "image/webp", "data": buf.getvalue()}
+
+
+def get_gemini_analysis(user_notes: str, image_hash: str, file_bytes: bytes, model_name: str, outcome: dict) -> Iterator[str]:
+    """Stream artifact analysis from Gemini AI, yielding text chunks as they arrive.
+
+    Why the stream ended (e.g. STOP, MAX_TOKENS, SAFETY) is written to
+    outcome["finish_reason"] so the caller can flag incomplete reports.
+    """
+    
+    model = _get_model(model_name)
+    
+    # The instructions live in the model's system_instruction, so the
+    # request only carries the user's notes and the image
+    content = []
+
+    if user_notes.strip():
+        content.append(f"Additional Context from User: {user_notes}\n")
+
+    # Full resolution adds upload bytes and vision tokens without improving the analysis
+    content.append(_prepare_for_gemini(image_hash, file_bytes))
+
+    # Transient errors (overload, timeout, quota) are retried with
+    # exponential backoff; everything else, including auth and bad-request
+    # errors that won't succeed on retry, fails fast. The API error is kept
+    # as __cause__ so the UI can explain it by type
+    retry_delays = [1, 2]
+    while True:
+        started = False
+        try:
+            # Hold a slot for the whole stream, the request is in flight until it ends
+            with _request_slot():
+                response = model.generate_content(
+                    content,
+                    stream=True,
+                    generation_config=GENERATION_CONFIG,
+                    request_options={"timeout": 120},
+                )
+                for chunk in response:
+                    # chunk.text raises on chunks without parts (blocked
+                    # prompt, final SAFETY/MAX_TOKENS chunk), so read parts
+                    if not chunk.candidates:
+                        outcome["finish_reason"] = f"BLOCKED ({chunk.prompt_feedback.block_reason.name})"
+                        continue
+                    candidate = chunk.candidates[0]
+                    if candidate.finish_reason:
+                        outcome["finish_reason"] = candidate.finish_reason.name
+                    text = "".join(part.text for part in candidate.content.parts)
+                    if text:
+                        started = True
+                        yield text
+            return
+            
+        except (gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.ResourceExhausted) as e:
+            # Output already shown to the user can't be retracted, so only
+            # retry if nothing was streamed yet
+            if started or not retry_delays:
+                raise AnalysisError(f"Failed to analyze: {str(e)}") from e
+            time.sleep(retry_delays.pop(0))
+            
+        except AnalysisError:
+            raise
             
         except Exception as e:
-            last_error = e
-            continue
-    
-    # If all models fail, raise the last error with helpful info
-    error_msg = f"Failed to analyze: {str(last_error)}"
-    raise Exception(error_msg)
+            raise AnalysisError(f"Failed to analyze: {str(e)}") from e
 
 
 # ============================================================
 # STREAMLIT UI CONFIGURATION
 # ============================================================
 
+# Oldest saved reports are dropped beyond this many per session
+MAX_SAVED_REPORTS = 10
+
+
+def save_report(analysis_key: tuple, result: str):
+    """Keep a finished report in the session, evicting the oldest"""
+    analyses = st.session_state.setdefault("analyses", {})
+    analyses[analysis_key] = result
+    while len(analyses) > MAX_SAVED_REPORTS:
+        analyses.pop(next(iter(analyses)))
+
+
+def discard_report(analysis_key: tuple):
+    """Button callback: forget a saved report and analyze again on this rerun"""
+    st.session_state.setdefault("analyses", {}).pop(analysis_key, None)
+    st.session_state.regenerate_report = True
+
+
+def add_download_button(result: str):
+    """Provide a download button for the full markdown report"""
+    try:
+        st.download_button(
+            label="Download Report",
+            data=result,
+            file_name="artifact_report.md",
+            mime="text/markdown",
+            help="Download the full artifact analysis as a Markdown file",
+        )
+    except Exception:
+        # Fallback: show a note if download button fails for any reason
+        st.info("Download not available in this environment.")
+
+
 def main():
     """Main application function"""
     
@@ -131,109 +518,7 @@ def main():
     )
 
     # Custom CSS for enhanced UI design
-    st.markdown("""
-        <style>
-            /* Theme Colors */
-            :root {
-                --primary-color: #8B4513;
-                --secondary-color: #D2B48C;
-                --accent-color: #CD853F;
-            }
-
-            /* Header styling */
-            .header-container {
-                background: linear-gradient(135deg, #8B4513 0%, #CD853F 100%);
-                padding: 2.5rem;
-                border-radius: 12px;
-                margin-bottom: 2rem;
-                box-shadow: 0 8px 20px rgba(139, 69, 19, 0.25);
-            }
-
-            .header-container h1 {
-                color: white;
-                margin: 0;
-                font-size: 2.8rem;
-                margin-bottom: 0.5rem;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.2);
-            }
-
-            .header-container p {
-                color: #FFF8DC;
-                margin: 0;
-                font-size: 1.15rem;
-            }
-
-            /* Card styling */
-            .info-card {
-                background: linear-gradient(135deg, #FFF8DC 0%, #FFE4B5 100%);
-                padding: 1.5rem;
-                border-radius: 10px;
-                border-left: 5px solid #CD853F;
-                box-shadow: 0 4px 12px rgba(139, 69, 19, 0.15);
-                margin-bottom: 1rem;
-            }
-
-            /* Button styling */
-            .stButton > button {
-                background: linear-gradient(135deg, #8B4513 0%, #CD853F 100%) !important;
-                color: white !important;
-                border: none !important;
-                border-radius: 8px !important;
-                padding: 0.8rem 2rem !important;
-                font-weight: 700 !important;
-                font-size: 1rem !important;
-                transition: all 0.3s ease !important;
-                box-shadow: 0 4px 15px rgba(139, 69, 19, 0.3) !important;
-            }
-
-            .stButton > button:hover {
-                transform: translateY(-3px) !important;
-                box-shadow: 0 8px 20px rgba(139, 69, 19, 0.4) !important;
-            }
-
-            /* Text area styling */
-            .stTextArea > div > div > textarea {
-                border-radius: 8px !important;
-                border: 2px solid #D2B48C !important;
-            }
-
-            /* Expander styling */
-            .streamlit-expanderHeader {
-                background-color: #FFF8DC !important;
-                border-radius: 8px !important;
-                border: 2px solid #D2B48C !important;
-            }
-
-            /* Success/Info messages */
-            .stSuccess {
-                background-color: #E8F5E9 !important;
-                border-left: 5px solid #4CAF50 !important;
-            }
-
-            .stInfo {
-                background-color: #E3F2FD !important;
-                border-left: 5px solid #2196F3 !important;
-            }
-
-            .stWarning {
-                background-color: #FFF3E0 !important;
-                border-left: 5px solid #FF9800 !important;
-            }
-
-            .stError {
-                background-color: #FFEBEE !important;
-                border-left: 5px solid #F44336 !important;
-            }
-
-            /* Divider */
-            hr {
-                border: none;
-                height: 2px;
-                background: linear-gradient(90deg, transparent, #CD853F, transparent);
-                margin: 2rem 0;
-            }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
     # Header section
     st.markdown("""
@@ -243,20 +528,25 @@ def main():
         </div>
     """, unsafe_allow_html=True)
 
+    # The session's first model discovery runs in the background so the
+    # page paints first; the result is only awaited once the selected model
+    # is needed. Later reruns read the cache directly, so its TTL applies
+    google_api_key = _bootstrap()
+    discovery = None
+    if google_api_key and not st.session_state.get("models_loaded"):
+        if "model_discovery" not in st.session_state:
+            st.session_state.model_discovery = _start_model_discovery(google_api_key)
+        discovery = st.session_state.model_discovery
+
     # Sidebar
     with st.sidebar:
         st.markdown("###  Configuration")
         
-        if GOOGLE_API_KEY:
+        if google_api_key:
             st.success("API Key Configured")
-            st.markdown(f"**Selected Model:** `{GEMINI_MODEL}`")
-            
-            if AVAILABLE_MODELS:
-                with st.expander(" Available Models"):
-                    for m in AVAILABLE_MODELS:
-                        st.write(f"✓ {m}")
-            else:
-                st.warning(" Could not detect available models")
+            model_status = st.empty()
+            if discovery is not None and not discovery.done():
+                model_status.info(" Loading models...")
         else:
             st.error("API Key Missing - Please add GOOGLE_API_KEY to .env")
         
@@ -296,7 +586,7 @@ def main():
 
         analyze_button = st.button(
             " Analyze Artifact",
-            disabled=uploaded_file is None or not GOOGLE_API_KEY,
+            disabled=uploaded_file is None or not google_api_key,
             type="primary",
             use_container_width=True,
         )
@@ -318,8 +608,27 @@ def main():
 
         if uploaded_file:
             try:
-                pil_image = Image.open(uploaded_file).convert("RGB")
-                st.image(pil_image, use_column_width=True, caption="Uploaded Artifact")
+                file_bytes = uploaded_file.getvalue()
+                image_hash = _image_hash(file_bytes)
+                pil_image = _load_image(image_hash, file_bytes)
+                # static/ is only served when .streamlit/config.toml was picked
+                # up, which depends on the directory the app was started from
+                image_url = None
+                if st.get_option("server.enableStaticServing"):
+                    extension = os.path.splitext(uploaded_file.name)[1].lower()
+                    try:
+                        image_url = _publish_static(image_hash, file_bytes, extension)
+                    except OSError:
+                        # Static folder not writable (read-only deploy, full disk)
+                        image_url = None
+
+                if image_url:
+                    st.markdown(f"""
+                        <img src="{image_url}" alt="Uploaded Artifact" style="width: 100%; border-radius: 8px;">
+                        <p style="text-align: center; color: gray; font-size: 0.9rem;">Uploaded Artifact</p>
+                    """, unsafe_allow_html=True)
+                else:
+                    st.image(pil_image, use_column_width=True, caption="Uploaded Artifact")
                 
                 # Image info
                 with st.expander(" Image Details", expanded=True):
@@ -338,47 +647,92 @@ def main():
             st.info(" Upload an artifact image to get started")
             pil_image = None
 
+    # Everything above has already rendered, so wait for discovery here
+    available_models, gemini_model = [], "gemini-2.5-flash"
+    if google_api_key:
+        if discovery is not None:
+            try:
+                available_models, gemini_model = discovery.result()
+                st.session_state.models_loaded = True
+            except Exception:
+                available_models, gemini_model = _load_models(google_api_key)
+            # Drop the Future once resolved so a failure isn't re-raised on every rerun
+            del st.session_state.model_discovery
+        else:
+            available_models, gemini_model = _load_models(google_api_key)
+
+        with model_status.container():
+            st.markdown(f"**Selected Model:** `{gemini_model}`")
+            
+            if available_models:
+                with st.expander(" Available Models"):
+                    for m in available_models:
+                        st.write(f"✓ {m}")
+            else:
+                st.warning(" Could not detect available models")
+
     # Results section
     st.markdown("---")
     st.markdown("###  Analysis Results")
 
-    if analyze_button:
+    # Reports already generated this session, so reruns and repeat clicks
+    # on the same upload + notes don't pay for another Gemini call
+    analyses = st.session_state.setdefault("analyses", {})
+    analysis_key = None
+    if pil_image is not None:
+        analysis_key = _analysis_key(image_hash, user_notes or "", gemini_model)
+    run_analysis = analyze_button or st.session_state.pop("regenerate_report", False)
+
+    if analysis_key in analyses:
+        # Saved reports render directly, without the spinner or banner
+        result = analyses[analysis_key]
+        with st.expander(" Full Artifact Report", expanded=True):
+            st.markdown(result)
+            add_download_button(result)
+            st.button(" Regenerate Report", on_click=discard_report, args=(analysis_key,))
+    elif run_analysis:
         if pil_image is None:
             st.error(" Please upload a valid image.")
-        elif not GOOGLE_API_KEY:
+        elif not google_api_key:
             st.error(" GOOGLE_API_KEY not configured. Add it to your .env file.")
         else:
             with st.spinner(" Analyzing artifact with Gemini AI... This may take a moment..."):
                 try:
-                    result = get_gemini_analysis(user_notes or "", pil_image)
-                    
-                    st.success(" Analysis Complete!")
-                    
-                    # Display in expander
+                    # Display in expander, rendering chunks as they arrive
                     with st.expander(" Full Artifact Report", expanded=True):
-                        st.markdown(result)
-
-                        # Provide a download button for the full markdown report
-                        try:
-                            st.download_button(
-                                label="Download Report",
-                                data=result,
-                                file_name="artifact_report.md",
-                                mime="text/markdown",
-                                help="Download the full artifact analysis as a Markdown file",
-                            )
-                        except Exception:
-                            # Fallback: show a note if download button fails for any reason
-                            st.info("Download not available in this environment.")
+                        outcome = {}
+                        result = st.write_stream(
+                            get_gemini_analysis(user_notes or "", image_hash, file_bytes, gemini_model, outcome)
+                        ) or ""
+                        finish_reason = outcome.get("finish_reason", "STOP")
+                        # Only complete reports are kept, so Analyze can retry the rest
+                        if finish_reason == "STOP":
+                            save_report(analysis_key, result)
+                        add_download_button(result)
+
+                    if finish_reason == "STOP":
+                        st.success(" Analysis Complete!")
+                    elif finish_reason == "MAX_TOKENS":
+                        # Thinking tokens come out of the same GENERATION_CONFIG budget
+                        if result:
+                            st.warning(" The report reached the output token limit and was cut short. Click Analyze to try again.")
+                        else:
+                            st.warning(" Gemini used the whole output token limit before writing the report. Click Analyze to try again.")
+                    else:
+                        st.warning(f" Gemini stopped before finishing the report (reason: {finish_reason}). The text above may be incomplete.")
                     
                 except Exception as e:
                     error_str = str(e)
                     st.error(f" Analysis failed: {error_str}")
                     st.markdown("#### Troubleshooting:")
                     
-                    error_msg = error_str.lower()
+                    cause = e.__cause__ if e.__cause__ is not None else e
+                    # Gemini reports a bad key as 400 InvalidArgument, not 401
+                    is_auth_error = isinstance(cause, (gexc.Unauthenticated, gexc.PermissionDenied)) or (
+                        isinstance(cause, gexc.InvalidArgument) and "api key" in str(cause).lower()
+                    )
                     
-                    if "not found" in error_msg or "not supported" in error_msg:
+                    if isinstance(cause, gexc.NotFound):
                         st.error("""
                         ** No Compatible Models Available**
                         
@@ -392,13 +746,13 @@ def main():
                         
                         **What models are available:**
                         """)
-                        if AVAILABLE_MODELS:
-                            for m in AVAILABLE_MODELS:
+                        if available_models:
+                            for m in available_models:
                                 st.info(f" {m}")
                         else:
                             st.warning("Could not detect any compatible models with your API key")
                             
-                    elif "401" in error_msg or "permission" in error_msg or "unauthorized" in error_msg or "invalid" in error_msg:
+                    elif is_auth_error:
                         st.error("""
                         ** Authentication Error**
                         
@@ -410,7 +764,17 @@ def main():
                         3. Remove any extra spaces from the key
                         4. Restart the Streamlit app
                         """)
-                    elif "rate limit" in error_msg:
+                    elif isinstance(e, QueueTimeoutError):
+                        st.warning("""
+                        ** Server Busy**
+                        
+                        Other analyses were using every available Gemini slot.
+                        
+                        **Solutions:**
+                        - Wait a minute and click Analyze again
+                        - Ask the administrator to raise `GEMINI_CONCURRENCY` if your API tier allows it
+                        """)
+                    elif isinstance(cause, gexc.ResourceExhausted):
                         st.warning("""
                         ** Rate Limit Exceeded**
                         